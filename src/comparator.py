@@ -1,6 +1,21 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
+from numba import njit, prange
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+@njit(parallel=True, cache=True)
+def compare_float_values(left_values, right_values):
+    # Equality and the missing-on-both-sides check fused into a single pass over the values
+    consistent = np.empty(left_values.shape, dtype=np.bool_)
+    for i in prange(left_values.shape[0]):
+        for j in range(left_values.shape[1]):
+            left_value = left_values[i, j]
+            right_value = right_values[i, j]
+            consistent[i, j] = left_value == right_value or (left_value != left_value and right_value != right_value)
+    return consistent
+
 
 class InconsistentDataTypesError(Exception):
     def __init__(self,
@@ -29,40 +44,51 @@ class TableReader():
     
     def read(self):
         if self.extension == "xlsx":
-            self.left_table = pd.read_excel(self.left_table_path)
-            self.right_table = pd.read_excel(self.right_table_path)
-        if self.extension in ["csv", "txt"]:
-            self.left_table = pd.read_csv(self.left_table_path, delimiter=self.delimiter)
-            self.right_table = pd.read_csv(self.right_table_path, delimiter=self.delimiter)
+            read_table, read_kwargs = pd.read_excel, {}
+        elif self.extension in ["csv", "txt"]:
+            read_table, read_kwargs = pd.read_csv, {"delimiter": self.delimiter, "dtype_backend": "pyarrow"}
+            # The pyarrow engine parses multithreaded, but it only supports single character delimiters
+            if self.delimiter is None or len(self.delimiter) == 1:
+                read_kwargs["engine"] = "pyarrow"
+        else:
+            raise ValueError(f"Unsupported extension: {self.extension}")
+
+        # Both files are read at the same time; this only helps csv and txt, whose parsers release the GIL,
+        # while read_excel (openpyxl) is pure Python and gains nothing from the second thread
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            left_future = executor.submit(read_table, self.left_table_path, **read_kwargs)
+            right_future = executor.submit(read_table, self.right_table_path, **read_kwargs)
+            self.left_table, self.right_table = left_future.result(), right_future.result()
         
 
 class TableComparator():
+    image_outputs = ["record_availability", "record_consistency"]
+    table_outputs = ["left_only", "right_only", "comparison_df"]
+
     def __init__(self,
                  left_table,
                  right_table,
                  primary_keys,
                  result_path,
-                 delimiter:str = None):
+                 delimiter:str = None,
+                 compute_full_comparison_df:bool = True):
         self.left_table = left_table
         self.right_table = right_table
         self.delimiter = delimiter
         self.primary_keys = primary_keys
         self.result_path = result_path
+        self.compute_full_comparison_df = compute_full_comparison_df
 
     def validate_data_quality(self):
         assert len(self.left_table.columns) == len(self.right_table.columns), "The tables must have the same number of columns."
         assert all(self.left_table.columns == self.right_table.columns), "Columns names are inconsistent."
-        if all(self.left_table.dtypes == self.right_table.dtypes) == False:
-            left_inconsistent_dict = self.right_table.dtypes[(self.left_table.dtypes == self.right_table.dtypes) == False].to_dict()
-            right_inconsistent_dict = self.left_table.dtypes[(self.left_table.dtypes == self.right_table.dtypes) == False].to_dict()
-
-            inconsistent_dict = {}
-            for key, value in left_inconsistent_dict.items():
-                inconsistent_dict[key] = {"left_table": left_inconsistent_dict[key].type,
-                                        "right_table": right_inconsistent_dict[key].type}
+        left_dtypes, right_dtypes = self.left_table.dtypes, self.right_table.dtypes
+        inconsistent_dtypes = left_dtypes.ne(right_dtypes)
+        if inconsistent_dtypes.any():
+            inconsistent_dict = {column: {"left_table": left_dtypes[column].type,
+                                          "right_table": right_dtypes[column].type}
+                                 for column in left_dtypes.index[inconsistent_dtypes]}
             raise InconsistentDataTypesError(inconsistent_dict)
-        assert all(self.left_table.duplicated(subset = self.primary_keys) == False), "The left table contains duplicates."
-        assert all(self.right_table.duplicated(subset = self.primary_keys) == False), "The right table contains duplicates."
 
 
     def join_tables(self):
@@ -71,48 +97,80 @@ class TableComparator():
                               on = self.primary_keys,
                               indicator=True,
                               suffixes=["_left_table", "_right_table"],
-                              how = "outer"))
+                              how = "outer",
+                              sort = False,
+                              validate = "one_to_one"))
+
+        self.left_value_columns = [column_name for column_name in self.joined.columns if column_name.endswith("_left_table")]
+        self.value_columns = [column_name.removesuffix("_left_table") for column_name in self.left_value_columns]
+        self.right_value_columns = [column_name + "_right_table" for column_name in self.value_columns]
 
     def split_joined_table(self):
+        # Row positions of each merge indicator value, computed in a single pass over the categorical
+        merge_groups = self.joined.groupby("_merge", sort=False, observed=True).indices
+        no_rows = np.array([], dtype=np.intp)
+
         # In the left table but not in the right table
-        left_only =  self.joined[self.joined["_merge"] == "left_only"].copy(deep = True)
-        columns = self.primary_keys + [column_name for column_name in left_only.columns if "_left_table" in column_name]
-        left_only = left_only[columns]
-        left_only.columns = [column.replace("_left_table","") for column in left_only.columns]
+        columns = self.primary_keys + self.left_value_columns
+        left_only = self.joined.iloc[merge_groups.get("left_only", no_rows), self.joined.columns.get_indexer(columns)].copy()
+        left_only.columns = self.primary_keys + self.value_columns
         self.left_only = left_only
 
         # In the right table but not in the left table
-        right_only =  self.joined[self.joined["_merge"] == "right_only"].copy(deep = True)
-        columns = self.primary_keys + [column_name for column_name in right_only.columns if "_right_table" in column_name]
-        right_only = right_only[columns]
-        right_only.columns = [column.replace("_right_table","") for column in right_only.columns]
+        columns = self.primary_keys + self.right_value_columns
+        right_only = self.joined.iloc[merge_groups.get("right_only", no_rows), self.joined.columns.get_indexer(columns)].copy()
+        right_only.columns = self.primary_keys + self.value_columns
         self.right_only = right_only
 
         # In both tables
-        self.both = self.joined[self.joined["_merge"] == "both"].copy(deep = True)
+        self.both = self.joined.iloc[merge_groups.get("both", no_rows)]
 
     def compare_records_in_both(self):
-        left_columns = self.primary_keys + [column_name for column_name in self.both.columns if "_left_table" in column_name]
-        right_columns = self.primary_keys + [column_name for column_name in self.both.columns if "_right_table" in column_name]
-
-        both = self.both[[column for column in self.both.columns if column != "_merge"]].copy()
-        both.fillna("", inplace=True)
-
-        comparison_df_list = []
-        for index, row in both.iterrows():
-            left_row = row[left_columns].reset_index(drop=True)
-            right_row = row[right_columns].reset_index(drop=True)
-            
-            comparison_rows = pd.DataFrame([left_row,
-                                            right_row,
-                                            left_row==right_row])
-            comparison_rows["comparison"] = ["left_table", "right_table", "comparison_result"]
-            comparison_df_list.append(comparison_rows)
-
-        comparison_df = pd.concat(comparison_df_list)
-        comparison_df.columns = list(self.left_table.columns) + ["comparison"]
-        comparison_df = comparison_df[["comparison"] + list(self.left_table.columns)]
-        self.comparison_df = comparison_df.reset_index(drop=True, inplace=False)
+        left_block = self.both[self.left_value_columns]
+        right_block = self.both[self.right_value_columns].set_axis(self.left_value_columns, axis=1)
+        records_count = len(self.both)
+
+        # Missing values on both sides count as consistent; float columns go through the compiled kernel
+        float_positions = [position for position, column in enumerate(self.left_value_columns)
+                           if pd.api.types.is_float_dtype(left_block[column]) and pd.api.types.is_float_dtype(right_block[column])]
+        other_positions = [position for position in range(len(self.left_value_columns)) if position not in float_positions]
+
+        consistent = np.empty((records_count, len(self.left_value_columns)), dtype=bool)
+        if float_positions:
+            consistent[:, float_positions] = compare_float_values(
+                left_block.iloc[:, float_positions].to_numpy(dtype=np.float64, na_value=np.nan),
+                right_block.iloc[:, float_positions].to_numpy(dtype=np.float64, na_value=np.nan))
+        if other_positions:
+            left_other, right_other = left_block.iloc[:, other_positions], right_block.iloc[:, other_positions]
+            consistent[:, other_positions] = (left_other.eq(right_other).fillna(False)
+                                              | (left_other.isna() & right_other.isna())).to_numpy(dtype=bool)
+
+        # The column mean of the boolean results is the share of consistent values
+        self.records_consistency = pd.Series(consistent.mean(axis=0) * 100, index=self.value_columns)
+
+        # The record by record comparison takes three rows per record, so it is only built on request
+        if not self.compute_full_comparison_df:
+            return
+
+        # Every record becomes three consecutive rows: left values, right values and their comparison
+        comparison_columns = {"comparison": np.tile(["left_table", "right_table", "comparison_result"], records_count)}
+        for key in self.primary_keys:
+            key_values = np.repeat(self.both[key].to_numpy(dtype=object), 3)
+            key_values[2::3] = True
+            comparison_columns[key] = key_values
+        for position, column in enumerate(self.value_columns):
+            column_values = np.empty(3 * records_count, dtype=object)
+            column_values[0::3] = left_block.iloc[:, position].to_numpy(dtype=object)
+            column_values[1::3] = right_block.iloc[:, position].to_numpy(dtype=object)
+            column_values[2::3] = consistent[:, position]
+            comparison_columns[column] = column_values
+
+        # Missing values are shown as empty cells in the exported comparison
+        for column_values in comparison_columns.values():
+            if column_values.dtype == object:
+                column_values[pd.isna(column_values)] = ""
+
+        self.comparison_df = pd.DataFrame(comparison_columns, columns=["comparison"] + list(self.left_table.columns), copy=False)
 
     def prepare_results(self):
         self.validate_data_quality()
@@ -121,13 +179,12 @@ class TableComparator():
         self.compare_records_in_both()
 
     def visualize_record_availability(self):
-        merge_counts = self.joined['_merge'].value_counts()
-        merge_counts_df = pd.DataFrame({'_merge': merge_counts.index, 'count': merge_counts.values})
-        merge_counts_df['percentage'] = (merge_counts_df['count'] / merge_counts_df['count'].sum()) * 100
+        merge_percentages = (self.joined['_merge']
+                             .value_counts(normalize=True)
+                             .mul(100)
+                             .rename(index={'left_only': 'Tylko w lewej', 'right_only': 'Tylko w prawej', 'both': 'W obu'}))
 
-        merge_counts_df['_merge'].replace({'left_only': 'Tylko w lewej', 'right_only': 'Tylko w prawej', 'both': 'W obu'}, inplace=True)
-
-        fig = px.pie(merge_counts_df, names='_merge', values='percentage', title='Dostępność danych w tabelach.')
+        fig = px.pie(names=merge_percentages.index, values=merge_percentages.values, title='Dostępność danych w tabelach.')
 
         fig.update_layout(
             autosize=False,
@@ -140,16 +197,7 @@ class TableComparator():
         self.record_availability = fig
 
     def visualize_record_consistency(self):
-        comparison_result = self.comparison_df[self.comparison_df["comparison"]=="comparison_result"]
-
-        columns = [column for column in comparison_result.columns if column not in ["comparison"] + self.primary_keys] 
-
-        records_consistency = {}
-        for column in columns:
-            records_consistency[column] = (comparison_result[comparison_result[column] == True].shape[0]/comparison_result.shape[0])
-
-        # Convert the dictionary to a DataFrame
-        df = pd.DataFrame({'Column': list(records_consistency.keys()), 'Percentage': [value * 100 for value in records_consistency.values()]})
+        df = self.records_consistency.rename_axis('Column').reset_index(name='Percentage')
 
         fig = px.bar(df, x='Column', y='Percentage', text='Percentage', title='Zgodność wartości według kolumn (w %)')
 
@@ -164,10 +212,35 @@ class TableComparator():
         self.visualize_record_availability()
         self.visualize_record_consistency()
 
-    def return_results(self):
-        self.record_availability.write_image(os.path.join(self.result_path,"record_availability.png"))
-        self.record_consistency.write_image(os.path.join(self.result_path,"record_consistency.png"))
-
-        self.left_only.to_excel(os.path.join(self.result_path,"left_only.xlsx"), index=False)
-        self.right_only.to_excel(os.path.join(self.result_path,"right_only.xlsx"), index=False)
-        self.comparison_df.to_excel(os.path.join(self.result_path,"comparison_df.xlsx"), index=False)
+    def return_results(self, outputs=None):
+        if outputs is None:
+            outputs = {"record_availability", "record_consistency", "left_only", "right_only"}
+            if self.compute_full_comparison_df:
+                outputs.add("comparison_df")
+
+        unknown_outputs = set(outputs) - set(self.image_outputs + self.table_outputs)
+        if unknown_outputs:
+            raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown_outputs))}. "
+                             f"Available outputs: {', '.join(self.image_outputs + self.table_outputs)}.")
+        if "comparison_df" in outputs and not self.compute_full_comparison_df:
+            raise ValueError("comparison_df was not computed, create the comparator with compute_full_comparison_df=True to export it.")
+
+        # The figures are only built for the images that are exported
+        if "record_availability" in outputs:
+            self.visualize_record_availability()
+        if "record_consistency" in outputs:
+            self.visualize_record_consistency()
+
+        # The exports are independent of each other, so they are written concurrently
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = []
+            for output in self.image_outputs:
+                if output in outputs:
+                    futures.append(executor.submit(getattr(self, output).write_image, os.path.join(self.result_path,f"{output}.png")))
+            for output in self.table_outputs:
+                if output in outputs:
+                    # xlsxwriter writes the cells without building an openpyxl workbook of cell objects first
+                    futures.append(executor.submit(getattr(self, output).to_excel, os.path.join(self.result_path,f"{output}.xlsx"), index=False, engine="xlsxwriter"))
+
+            for future in futures:
+                future.result()
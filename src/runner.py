@@ -1,6 +1,5 @@
-import time
-import tkinter as tk
-from tkinter import filedialog
+import argparse
+import os
 from comparator import TableComparator, TableReader
 
 class ExtensionsNotMatchingError(Exception):
@@ -10,13 +9,18 @@ class ExtensionsNotMatchingError(Exception):
         super().__init__(self.message)
 
 def retrieve_extension(left_table_path, right_table_path):
-    if left_table_path.split(".")[-1] == right_table_path.split(".")[-1]:
-        extension = right_table_path.split(".")[-1]
-        return extension
+    left_extension = os.path.splitext(left_table_path)[1].lower().lstrip(".")
+    right_extension = os.path.splitext(right_table_path)[1].lower().lstrip(".")
+    if left_extension == right_extension:
+        return right_extension
     else:
         raise ExtensionsNotMatchingError()
 
 def get_user_input():
+    # Imported here so scripted runs work on Python builds without Tk
+    import tkinter as tk
+    from tkinter import filedialog
+
     root = tk.Tk()
     root.withdraw()  # Hide the main tkinter window
 
@@ -44,29 +48,58 @@ def get_user_input():
 
     return left_table_path, right_table_path, extension, delimiter, primary_keys, result_path
 
-def main():
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two tables record by record using their primary keys.")
+    parser.add_argument("--interactive", action="store_true", help="Select the tables and options in dialogs (default when no paths are given).")
+    parser.add_argument("--left", help="Path to the left table.")
+    parser.add_argument("--right", help="Path to the right table.")
+    parser.add_argument("--delimiter", default=None, help="Delimiter of csv and txt tables.")
+    parser.add_argument("--keys", help="Primary keys (comma-separated).")
+    parser.add_argument("--out", help="Path to save results.")
+
+    args = parser.parse_args(argv)
+
+    scripted_arguments = [args.left, args.right, args.keys, args.out]
+    if args.interactive and any(argument is not None for argument in scripted_arguments + [args.delimiter]):
+        parser.error("--interactive cannot be combined with --left, --right, --delimiter, --keys or --out.")
+    if all(argument is None for argument in scripted_arguments):
+        args.interactive = True
+    if not args.interactive and any(argument is None for argument in scripted_arguments):
+        parser.error("--left, --right, --keys and --out are required unless --interactive is given.")
+
+    return args
+
+def run_comparison(left_table_path, right_table_path, extension, delimiter, primary_keys, result_path):
+    reader = TableReader(left_table_path=left_table_path, right_table_path=right_table_path, extension=extension, delimiter=delimiter)
+    reader.read()
+
+    comparator = TableComparator(reader.left_table, reader.right_table, primary_keys=primary_keys, result_path=result_path)
+
+    comparator.prepare_results()
+    comparator.return_results()
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    if not args.interactive:
+        extension = retrieve_extension(args.left, args.right)
+        run_comparison(args.left, args.right, extension, args.delimiter, args.keys.split(','), args.out)
+        return
+
     print("\nWelcome to the table comparator. Please provide your input to run che comparison:")
 
     while True:
         left_table_path, right_table_path, extension, delimiter, primary_keys, result_path = get_user_input()
 
         print("\nComparison in progress. Please wait...")
-        reader = TableReader(left_table_path=left_table_path, right_table_path=right_table_path, extension=extension, delimiter=delimiter)
-        reader.read()
-               
-        comparator = TableComparator(reader.left_table, reader.right_table, primary_keys=primary_keys, result_path=result_path)
-
-        comparator.prepare_results()
-        comparator.visualize_results()
-        comparator.return_results()
+        run_comparison(left_table_path, right_table_path, extension, delimiter, primary_keys, result_path)
 
         print("""\nThe comparison has run successfully. The results are saved in the specifued path.""")
 
         run_again = input("Do you want to run the program again? (y/n): ").strip().lower()
 
         if run_again != "y":
-            print("\nThank you! The program will close in 5 seconds...")
-            time.sleep(5)  # Wait for 5 seconds
+            print("\nThank you!")
             break
 
 if __name__ == "__main__":